@@ -1,4 +1,3 @@
-import os
 import pathlib
 from typing import Dict, List
 
@@ -8,12 +7,7 @@ from transformers import pipeline
 
 import trlx
 from trlx.data.configs import TRLConfig
-
-
-def get_positive_score(scores):
-    "Extract value associated with a positive sentiment from pipeline's output"
-    return dict(map(lambda x: tuple(x.values()), scores))["POSITIVE"]
-
+from trlx.utils import get_pipeline_device_kwargs, get_positive_score
 
 config_path = pathlib.Path(__file__).parent.joinpath("../configs/ilql_config.yml")
 with config_path.open() as f:
@@ -29,7 +23,7 @@ def main(hparams={}):
         top_k=2,
         truncation=True,
         batch_size=256,
-        device=0 if int(os.environ.get("LOCAL_RANK", 0)) == 0 else -1,
+        **get_pipeline_device_kwargs(),
     )
 
     def metric_fn(samples: List[str], **kwargs) -> Dict[str, List[float]]:
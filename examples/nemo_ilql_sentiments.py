@@ -7,12 +7,7 @@ from transformers import pipeline
 
 import trlx
 from trlx.data.configs import TRLConfig
-
-
-def get_positive_score(scores):
-    "Extract value associated with a positive sentiment from pipeline's output"
-    return dict(map(lambda x: tuple(x.values()), scores))["POSITIVE"]
-
+from trlx.utils import get_positive_score
 
 default_config = yaml.safe_load(open(os.path.dirname(__file__) + "/../configs/nemo_ilql_config.yml"))
 
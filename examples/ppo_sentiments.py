@@ -1,23 +1,16 @@
 # Generates positive movie reviews by tuning a pretrained model on IMDB dataset
 # with a sentiment reward function
 
-import os
 import pathlib
 from typing import List
 
-import torch
 import yaml
 from datasets import load_dataset
 from transformers import pipeline
 
 import trlx
 from trlx.data.configs import TRLConfig
-
-
-def get_positive_score(scores):
-    "Extract value associated with a positive sentiment from pipeline's output"
-    return dict(map(lambda x: tuple(x.values()), scores))["POSITIVE"]
-
+from trlx.utils import get_pipeline_device_kwargs, get_positive_score
 
 config_path = pathlib.Path(__file__).parent.joinpath("../configs/ppo_config.yml")
 with config_path.open() as f:
@@ -27,18 +20,13 @@ with config_path.open() as f:
 def main(hparams={}):
     config = TRLConfig.update(default_config, hparams)
 
-    if torch.cuda.is_available():
-        device = int(os.environ.get("LOCAL_RANK", 0))
-    else:
-        device = -1
-
     sentiment_fn = pipeline(
         "sentiment-analysis",
         "lvwerra/distilbert-imdb",
         top_k=2,
         truncation=True,
         batch_size=256,
-        device=device,
+        **get_pipeline_device_kwargs(),
     )
 
     def reward_fn(samples: List[str], **kwargs) -> List[float]:
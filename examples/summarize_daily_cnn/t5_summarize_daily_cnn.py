@@ -2,7 +2,6 @@ import pathlib
 from typing import List
 
 from datasets import load_dataset
-from tqdm import tqdm
 from transformers import AutoTokenizer
 
 import trlx
@@ -49,19 +48,14 @@ if __name__ == "__main__":
     prompt_label = {}
     max_length = config.train.seq_length - config.method.gen_kwargs["max_new_tokens"]
 
-    for i in tqdm(range(len(prompts))):
-        key = tokenizer.decode(
-            tokenizer(prompts[i], truncation=True, max_length=max_length)["input_ids"],
+    # get prompts like trlx's prompts, tokenizing and decoding them in batches
+    for texts, labels in [(prompts, summaries), (val_prompts, val_summaries)]:
+        keys = tokenizer.batch_decode(
+            tokenizer(texts, truncation=True, max_length=max_length)["input_ids"],
             skip_special_tokens=True,
-        )  # get prompt like trlx's prompt
-        prompt_label[key.strip()] = summaries[i]
-
-    for i in tqdm(range(len(val_prompts))):
-        key = tokenizer.decode(
-            tokenizer(val_prompts[i], truncation=True, max_length=max_length)["input_ids"],
-            skip_special_tokens=True,
-        )  # get prompt like trlx's prompt
-        prompt_label[key.strip()] = val_summaries[i]
+        )
+        for key, label in zip(keys, labels):
+            prompt_label[key.strip()] = label
 
     trlx.train(
         config.model.model_path,
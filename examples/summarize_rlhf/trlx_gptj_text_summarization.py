@@ -5,7 +5,6 @@ from typing import List
 import torch
 from datasets import load_dataset
 from reward_model.reward_model import GPTRewardModel
-from tqdm import tqdm
 from transformers import AutoTokenizer
 
 import trlx
@@ -60,23 +59,23 @@ if __name__ == "__main__":
         Get the prompt after T5 decoding to make sure dictionary
         of prompts and summaries is consistent decode prompt from trlX pipeline
         """
-        formatted_prompts = []
-        for i in tqdm(range(len(prompts))):
-            tmp = tokenizer.decode(
-                tokenizer(
-                    prompts[i].split("TL;DR:")[0],
-                    truncation=True,
-                    max_length=max_length - 5,  # to make sure "TL;DR" dont get truncated
-                )["input_ids"],
-                skip_special_tokens=True,
-            ).strip()
-            tmp = tmp + "\nTL;DR:"
-            tmp = tokenizer.decode(
-                tokenizer(tmp, truncation=True, max_length=max_length)["input_ids"],
-                skip_special_tokens=True,
-            ).strip()
-            formatted_prompts.append(tmp)
-        return formatted_prompts
+        posts = tokenizer.batch_decode(
+            tokenizer(
+                [prompt.split("TL;DR:")[0] for prompt in prompts],
+                truncation=True,
+                max_length=max_length - 5,  # to make sure "TL;DR" dont get truncated
+            )["input_ids"],
+            skip_special_tokens=True,
+        )
+        formatted_prompts = tokenizer.batch_decode(
+            tokenizer(
+                [post.strip() + "\nTL;DR:" for post in posts],
+                truncation=True,
+                max_length=max_length,
+            )["input_ids"],
+            skip_special_tokens=True,
+        )
+        return [prompt.strip() for prompt in formatted_prompts]
 
     def reward_fn(samples: List[str], **kwargs):
         original_samples = [text.split("TL;DR:")[0] + "TL;DR: " for text in samples]
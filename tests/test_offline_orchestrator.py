@@ -0,0 +1,89 @@
+import copy
+
+import pytest
+from transformers import AutoTokenizer
+
+from trlx.data.configs import TRLConfig
+from trlx.orchestrator.offline_orchestrator import (
+    tokenize_dialogue,
+    tokenize_dialogues,
+    truncate_dialogue,
+)
+
+BOS = -1
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    config = TRLConfig.load_yaml("configs/test_config.yml")
+    return AutoTokenizer.from_pretrained(config.tokenizer.tokenizer_path)
+
+
+def test_truncate_dialogue_right():
+    dialogue = [[1, 2], [3, 4, 5], [6, 7]]
+    assert truncate_dialogue(dialogue, 4, "right", BOS) == [[1, 2], [3, 4]]
+    assert truncate_dialogue(dialogue, 10, "right", BOS) == dialogue
+
+
+def test_truncate_dialogue_left():
+    dialogue = [[1, 2], [3, 4, 5], [6, 7]]
+    assert truncate_dialogue(dialogue, 4, "left", BOS) == [[4, 5], [6, 7]]
+
+
+def test_truncate_dialogue_left_forces_bos():
+    # An odd number of phrases that doesn't fill the context gets a <bos> prompt in front
+    assert truncate_dialogue([[1, 2], [3, 4], [5]], 10, "left", BOS) == [[BOS], [1, 2], [3, 4], [5]]
+
+    # When the context is full, the first kept token makes room for the <bos> prompt
+    dialogue = [[1], [2, 3], [4, 5], [6, 7]]
+    original = copy.deepcopy(dialogue)
+    out = truncate_dialogue(dialogue, 5, "left", BOS)
+    assert out == [[BOS], [], [4, 5], [6, 7]]
+    assert sum(map(len, out)) == 5
+    assert dialogue == original
+
+
+def test_tokenize_dialogue_str(tokenizer):
+    ids = tokenizer("hello world").input_ids
+    out = tokenize_dialogue("hello world", tokenizer)
+    assert out == [[tokenizer.bos_token_id], ids + [tokenizer.eos_token_id]]
+
+
+def test_tokenize_dialogue_list(tokenizer):
+    prompt_ids = tokenizer("Q: hello").input_ids
+    output_ids = tokenizer(" A: world").input_ids
+    out = tokenize_dialogue(["Q: hello", " A: world"], tokenizer)
+    # Only the last phrase is terminated with <eos>
+    assert out == [prompt_ids, output_ids + [tokenizer.eos_token_id]]
+
+
+def test_tokenize_dialogues(tokenizer):
+    dialogues = ["hello world", ["Q: hello", " A: world"], ["Q: one", " A: two", " Q: three", " A: four"]]
+    original = copy.deepcopy(dialogues)
+
+    out = tokenize_dialogues(dialogues, tokenizer)
+    assert out == [tokenize_dialogue(dialogue, tokenizer) for dialogue in dialogues]
+    assert [len(sample) for sample in out] == [2, 2, 4]
+    assert dialogues == original
+
+
+def test_tokenize_dialogues_truncation(tokenizer):
+    dialogue = ["Q: one", " A: two", " Q: three", " A: four"]
+    ids = [tokenizer(phrase).input_ids for phrase in dialogue]
+    ids[-1] = ids[-1] + [tokenizer.eos_token_id]
+    # Keeps the last two phrases and one token of the second, which then makes room for <bos>
+    max_length = len(ids[-1]) + len(ids[-2]) + 1
+
+    truncation_side = tokenizer.truncation_side
+    try:
+        tokenizer.truncation_side = "left"
+        out = tokenize_dialogues([dialogue], tokenizer, max_length)[0]
+        assert out == truncate_dialogue(ids, max_length, "left", tokenizer.bos_token_id)
+        assert out == [[tokenizer.bos_token_id], [], ids[-2], ids[-1]]
+
+        tokenizer.truncation_side = "right"
+        out = tokenize_dialogues([dialogue], tokenizer, max_length)[0]
+        assert out == truncate_dialogue(ids, max_length, "right", tokenizer.bos_token_id)
+        assert out[0] == ids[0][:max_length]
+    finally:
+        tokenizer.truncation_side = truncation_side
@@ -4,6 +4,9 @@ import torch
 from transformers import AutoTokenizer
 
 from trlx.data.configs import TRLConfig
+from trlx.data.ppo_types import PPORLBatch
+from trlx.orchestrator.ppo_orchestrator import slice_rollouts
+from trlx.trainer.accelerate_ppo_trainer import AcceleratePPOTrainer
 from trlx.trainer.nn.ppo_models import CausalLMHydraWithValueHead
 from trlx.utils.modeling import RunningMoments
 
@@ -82,3 +85,125 @@ class TestStatistics(unittest.TestCase):
         a = torch.hstack((self.a1, self.a2, self.a3, self.a4))
         assert torch.isclose(self.m.mean, a.mean(), atol=1e-6)
         assert torch.isclose(self.m.std, a.std(unbiased=True), atol=1e-6)
+
+
+class TestAdvantages(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = TRLConfig.load_yaml("configs/test_config.yml")
+        cls.method = config.method
+        cls.values = torch.randn(4, 12)
+        cls.rewards = torch.randn(4, 12)
+
+    def reference_advantages(self, values, rewards, response_length):
+        lastgaelam = 0
+        advantages_reversed = []
+        for t in reversed(range(response_length)):
+            nextvalues = values[:, t + 1] if t < response_length - 1 else 0.0
+            delta = rewards[:, t] + self.method.gamma * nextvalues - values[:, t]
+            lastgaelam = delta + self.method.gamma * self.method.lam * lastgaelam
+            advantages_reversed.append(lastgaelam)
+        return torch.stack(advantages_reversed[::-1], dim=1)
+
+    def test_advantages_and_returns(self):
+        response_length = self.rewards.shape[1]
+        advantages, returns = self.method.get_advantages_and_returns(
+            self.values, self.rewards, response_length, use_whitening=False
+        )
+        expected_advantages = self.reference_advantages(self.values, self.rewards, response_length)
+        self.assertTrue(torch.allclose(advantages, expected_advantages, atol=1e-5))
+        self.assertTrue(torch.allclose(returns, expected_advantages + self.values, atol=1e-5))
+
+
+class TestSliceRollouts(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kl_coef = 0.05
+        cls.scores = torch.randn(3)
+
+    def reference_rollouts(self, logprobs, ref_logprobs, values, start, ends, values_start):
+        # Per-sample slicing, as rollouts were built before being vectorized
+        out = []
+        for ix in range(len(ends)):
+            sample_logprobs = logprobs[ix, start : ends[ix]]
+            sample_values = values[ix, values_start : values_start + ends[ix] - start]
+            rewards = -self.kl_coef * (logprobs[ix, start : ends[ix]] - ref_logprobs[ix, start : ends[ix]])
+            if len(rewards) == 0:
+                out.append(None)
+                continue
+            rewards[-1] += self.scores[ix]
+            out.append((sample_logprobs, sample_values, rewards))
+        return out
+
+    def check_rollouts(self, logprobs, ref_logprobs, values, start, ends, values_start):
+        expected = self.reference_rollouts(logprobs, ref_logprobs, values, start, ends, values_start)
+        logprobs, values, rewards, response_lengths = slice_rollouts(
+            logprobs, ref_logprobs, values, self.scores, start, ends, values_start, self.kl_coef
+        )
+        for ix, response_length in enumerate(response_lengths):
+            if response_length <= 0:
+                self.assertIsNone(expected[ix])
+                continue
+            sample = (logprobs[ix, :response_length], values[ix, :response_length], rewards[ix, :response_length])
+            # Logprobs, values and rewards of each element must cover the same response positions
+            self.assertEqual([len(tensor) for tensor in sample], [len(expected[ix][0])] * 3)
+            for tensor, expected_tensor in zip(sample, expected[ix]):
+                self.assertTrue(torch.allclose(tensor, expected_tensor))
+
+    def test_causal(self):
+        # Sequences of length 10 with a prompt of 4 tokens; logprobs and values are one shorter
+        seq_length, start = 10, 3
+        logprobs, ref_logprobs, values = torch.randn(3, 3, seq_length - 1).unbind(0)
+        # The first response has no padding, the last one is empty
+        ends = start + torch.tensor([seq_length - start, 4, 1])
+        self.check_rollouts(logprobs, ref_logprobs, values, start, ends, start)
+
+    def test_seq2seq(self):
+        # Decoder outputs of length 8, values are predicted one position ahead of logprobs
+        output_length, start = 8, 1
+        logprobs, ref_logprobs = torch.randn(2, 3, output_length - 1).unbind(0)
+        values = torch.randn(3, output_length)
+        ends = torch.tensor([output_length - 1, 3, 0])
+        self.check_rollouts(logprobs, ref_logprobs, values, start, ends, start - 1)
+
+
+class TestMinibatchTraining(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = TRLConfig.load_yaml("configs/test_config.yml")
+        config.train.tracker = None
+        config.train.batch_size = 8
+        config.train.minibatch_size = 2
+        cls.trainer = AcceleratePPOTrainer(config)
+
+        response_length = 6
+        cls.batch = PPORLBatch(
+            query_tensors=torch.randint(0, 50000, (8, 4)),
+            response_tensors=torch.randint(0, 50000, (8, response_length)),
+            logprobs=-torch.rand(8, response_length),
+            values=torch.randn(8, response_length),
+            rewards=torch.randn(8, response_length),
+        )
+
+    def test_train_step(self):
+        mb_stats = []
+        loss_fn = self.trainer.loss
+
+        def loss(minibatch):
+            self.assertEqual(len(minibatch.query_tensors), 2)
+            loss, stats = loss_fn(minibatch)
+            mb_stats.append(stats)
+            return loss, stats
+
+        self.trainer.loss = loss
+        try:
+            stats = self.trainer.train_step(self.batch)
+        finally:
+            del self.trainer.loss
+
+        self.assertEqual(len(mb_stats), 4)
+        approx_kl = sum(s["policy/approx_kl"] for s in mb_stats) / 4
+        self.assertAlmostEqual(stats["policy/approx_kl"], approx_kl, places=5)
+        self.assertAlmostEqual(self.trainer.approx_kl, approx_kl, places=5)
+        self.assertAlmostEqual(stats["values/min"], min(s["values/min"] for s in mb_stats), places=5)
+        self.assertAlmostEqual(stats["values/max"], max(s["values/max"] for s in mb_stats), places=5)
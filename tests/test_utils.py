@@ -5,6 +5,7 @@ import transformers
 
 import trlx.utils as utils
 import trlx.utils.modeling as modeling_utils
+from trlx.data.ppo_types import PPORLBatch
 
 try:
     import bitsandbytes
@@ -50,6 +51,37 @@ def test_scheduler_class_getters(scheduler_name: str):
     assert _class == torch.optim.lr_scheduler.CosineAnnealingLR
 
 
+def test_split_batch():
+    batch = PPORLBatch(
+        query_tensors=torch.arange(16).view(8, 2),
+        response_tensors=torch.arange(24).view(8, 3),
+        logprobs=torch.randn(8, 3),
+        values=torch.randn(8, 3),
+        rewards=torch.randn(8, 3),
+    )
+    minibatches = utils.split_batch(batch, 4)
+    assert len(minibatches) == 4
+    for ix, minibatch in enumerate(minibatches):
+        assert isinstance(minibatch, PPORLBatch)
+        assert torch.equal(minibatch.query_tensors, batch.query_tensors[2 * ix : 2 * (ix + 1)])
+        assert torch.equal(minibatch.rewards, batch.rewards[2 * ix : 2 * (ix + 1)])
+
+    assert utils.split_batch(batch, 1)[0] is batch
+
+    # A batch smaller than the number of chunks is not split into empty chunks
+    short_batch = utils.split_batch(batch, 4)[0]
+    minibatches = utils.split_batch(short_batch, 4)
+    assert len(minibatches) == 2
+    assert all(len(minibatch.query_tensors) == 1 for minibatch in minibatches)
+
+    # Shuffling permutes the samples but keeps the fields of a sample aligned
+    shuffled = utils.split_batch(batch, 4, shuffle=True)
+    query_tensors = torch.cat([minibatch.query_tensors for minibatch in shuffled])
+    response_tensors = torch.cat([minibatch.response_tensors for minibatch in shuffled])
+    assert torch.equal(query_tensors[:, 0].sort().values, batch.query_tensors[:, 0])
+    assert torch.equal(response_tensors[:, 0] // 3, query_tensors[:, 0] // 2)
+
+
 # Test modeling utils
 
 
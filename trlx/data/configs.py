@@ -140,6 +140,11 @@ class TrainConfig:
     :param batch_size: Batch size for training
     :type batch_size: int
 
+    :param minibatch_size: Size of the minibatches `batch_size` is split into for gradient accumulation.
+                           Gradients are accumulated over all minibatches of a batch before the optimizer step.
+                           Defaults to `batch_size`, i.e. no gradient accumulation
+    :type minibatch_size: Optional[int]
+
     :param tracker: Tracker to use for logging. Default: "wandb"
     :type tracker: str
 
@@ -208,6 +213,8 @@ class TrainConfig:
     tracker: Optional[str] = "wandb"
     logging_dir: Optional[str] = None
 
+    minibatch_size: Optional[int] = None
+
     seed: int = 1000
 
     @classmethod
@@ -2,6 +2,8 @@ from dataclasses import dataclass
 
 from torchtyping import TensorType
 
+from trlx.utils import tree_map
+
 
 @dataclass
 class PPORLElement:
@@ -63,3 +65,7 @@ class PPORLBatch:
     logprobs: TensorType["batch_size", "response_size", "vocab_size"]
     values: TensorType["batch_size", "response_size"]
     rewards: TensorType["batch_size", "response_size"]
+
+    def pin_memory(self):
+        """Pins all tensors of the batch, called by `DataLoader` when `pin_memory=True`"""
+        return tree_map(lambda x: x.pin_memory(), self)
@@ -1,3 +1,4 @@
+import itertools
 import os
 from typing import List, Union
 
@@ -13,38 +14,43 @@ from trlx.pipeline.offline_pipeline import ILQLRolloutStorage
 logger = logging.get_logger(__name__)
 
 
-def tokenize_dialogue(  # noqa: C901
-    dialogue: Union[str, List[str]], tokenizer, max_length=2048, truncation_side="left"
-) -> List[int]:
+def split_dialogue(dialogue: Union[str, List[str]], tokenizer) -> List[str]:
     """
-    Tokenize sample with the interleaved form of (prompt_1, output_1, prompt_2, output_2...)
+    Split sample into its phrases of the interleaved form (prompt_1, output_1, prompt_2, output_2...)
     """
     if isinstance(dialogue, str):
-        dialogue = [tokenizer.bos_token, dialogue]
-    elif isinstance(dialogue, tuple):
-        dialogue = list(dialogue)
-    dialogue[-1] += tokenizer.eos_token
+        return [tokenizer.bos_token, dialogue]
+    return list(dialogue)
+
 
+def truncate_dialogue(  # noqa: C901
+    dialogue: List[List[int]], max_length: int, truncation_side: str, bos_token_id: int
+) -> List[List[int]]:
+    """
+    Truncate already tokenized phrases of a sample to fit in `max_length` tokens in total
+    """
     out = []
     ctx_length = max_length
-    if tokenizer.truncation_side == "left":
+    if truncation_side == "left":
+        # collect the kept phrases back to front and restore their order once at the end
         for phrase in reversed(dialogue):
-            tokens = tokenizer(phrase).input_ids[-ctx_length:]
+            tokens = phrase[-ctx_length:]
             ctx_length -= len(tokens)
-            out.insert(0, tokens)
+            out.append(tokens)
             if ctx_length == 0:
                 break
+        out.reverse()
 
         # in case of odd number of phrases (possibly due to truncation)
         # since the first phrase always has to be a prompt, force it to be <bos>
         if len(out) % 2 == 1:
-            if sum(map(len, out)) == max_length:
-                out[0].pop(0)
-            out.insert(0, [tokenizer.bos_token_id])
+            if ctx_length == 0:
+                out[0] = out[0][1:]
+            out = [[bos_token_id]] + out
 
-    elif tokenizer.truncation_side == "right":
+    elif truncation_side == "right":
         for phrase in dialogue:
-            tokens = tokenizer(phrase).input_ids[:ctx_length]
+            tokens = phrase[:ctx_length]
             ctx_length -= len(tokens)
             out.append(tokens)
             if ctx_length == 0:
@@ -52,6 +58,36 @@ def tokenize_dialogue(  # noqa: C901
     return out
 
 
+def tokenize_dialogues(dialogues: List[Union[str, List[str]]], tokenizer, max_length=2048) -> List[List[List[int]]]:
+    """
+    Tokenize samples with the interleaved form of (prompt_1, output_1, prompt_2, output_2...)
+    with a single tokenizer call over all of their phrases
+    """
+    dialogues = [split_dialogue(dialogue, tokenizer) for dialogue in dialogues]
+    all_phrases = list(itertools.chain.from_iterable(dialogues))
+    all_phrases_ids = tokenizer(all_phrases).input_ids
+
+    eos_token_id = tokenizer.eos_token_id
+    bos_token_id = tokenizer.bos_token_id
+    out = []
+    offset = 0
+    for dialogue in dialogues:
+        phrases_ids = all_phrases_ids[offset : offset + len(dialogue)]
+        offset += len(dialogue)
+        phrases_ids[-1] = phrases_ids[-1] + [eos_token_id]
+        out.append(truncate_dialogue(phrases_ids, max_length, tokenizer.truncation_side, bos_token_id))
+    return out
+
+
+def tokenize_dialogue(
+    dialogue: Union[str, List[str]], tokenizer, max_length=2048, truncation_side="left"
+) -> List[List[int]]:
+    """
+    Tokenize sample with the interleaved form of (prompt_1, output_1, prompt_2, output_2...)
+    """
+    return tokenize_dialogues([dialogue], tokenizer, max_length)[0]
+
+
 @register_orchestrator
 class OfflineOrchestrator(Orchestrator):
     """
@@ -68,28 +104,28 @@ class OfflineOrchestrator(Orchestrator):
         logger.info("Collecting rollouts")
 
         if self.trainer.tokenizer:
-            samples = [tokenize_dialogue(s, self.trainer.tokenizer, max_length) for s in samples]
+            samples = tokenize_dialogues(samples, self.trainer.tokenizer, max_length)
 
         all_input_ids = []
         all_actions_ixs = []
         all_states_ixs = []
         all_dones = []
         for sample in samples:
-            length = 0
-            all_input_ids.append(torch.tensor(sum(sample, [])))
-            isoutput = False
-            actions_ixs = []
-            for phrase in sample:
-                if isoutput:
-                    actions_ixs.append(torch.arange(length - 1, length + len(phrase) - 1))
-
-                length += len(phrase)
-                isoutput = not isoutput
-
-            states_ixs = torch.hstack((*actions_ixs, torch.tensor(length - 1)))
-            all_dones.append(torch.tensor([1] * (len(states_ixs) - 1) + [0], dtype=int))
-            all_actions_ixs.append(torch.hstack(actions_ixs))
-            all_states_ixs.append(states_ixs)
+            all_input_ids.append(torch.as_tensor(list(itertools.chain.from_iterable(sample)), dtype=torch.long))
+
+            # Phrases alternate between prompts and outputs, with every token of an output
+            # being an action taken from the state right before it
+            phrase_lengths = np.fromiter(map(len, sample), dtype=np.int64, count=len(sample))
+            length = phrase_lengths.sum()
+            isoutput = np.repeat(np.arange(len(sample)) % 2 == 1, phrase_lengths)
+            actions_ixs = np.flatnonzero(isoutput) - 1
+            states_ixs = np.append(actions_ixs, length - 1)
+            dones = np.ones_like(states_ixs)
+            dones[-1] = 0
+
+            all_actions_ixs.append(torch.from_numpy(actions_ixs))
+            all_states_ixs.append(torch.from_numpy(states_ixs))
+            all_dones.append(torch.from_numpy(dones))
 
         if self.trainer.tokenizer and os.environ.get("RANK", "0") == "0":
             logger.info("Logging sample example")
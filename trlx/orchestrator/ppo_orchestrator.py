@@ -1,10 +1,9 @@
 import os
 from time import time
-from typing import List
+from typing import List, Tuple
 
 import ray
 import torch
-import torch.nn.functional as F
 from torch.utils.data import DataLoader
 
 import trlx.utils.logging as logging
@@ -19,6 +18,37 @@ from trlx.utils.modeling import RunningMoments, logprobs_of_labels
 logger = logging.get_logger(__name__)
 
 
+def slice_rollouts(
+    logprobs: torch.Tensor,
+    ref_logprobs: torch.Tensor,
+    values: torch.Tensor,
+    scores: torch.Tensor,
+    start: int,
+    ends: torch.Tensor,
+    values_start: int,
+    kl_coef: float,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, List[int]]:
+    """Computes the rewards of a batch of rollouts and slices out their response positions
+
+    The reward of each response token is the KL penalty against the reference model, plus
+    the sample's score on its last token (at position `ends - 1` of `logprobs`).
+
+    Returns:
+        logprobs, values and rewards starting from the first response position, along with
+        the length of each response. Samples with a non-positive length have no response.
+    """
+    # A response without padding ends at the last position that has a logprob
+    ends = ends.clamp(max=logprobs.shape[1])
+
+    rewards = -kl_coef * (logprobs - ref_logprobs)
+    rewards[torch.arange(len(scores), device=rewards.device), ends - 1] += scores
+
+    logprobs = logprobs[:, start:]
+    values = values[:, values_start : values_start + logprobs.shape[1]]
+    rewards = rewards[:, start:]
+    return logprobs, values, rewards, (ends - start).tolist()
+
+
 @register_orchestrator
 class PPOOrchestrator(Orchestrator):
     """PPO Orchestrator
@@ -55,8 +85,22 @@ class PPOOrchestrator(Orchestrator):
         self.pipeline_iterator = iter(self.pipeline_loader)
 
         if not hasattr(self.trainer.model, "frozen_head"):
+            # The reference model is only ever used for inference: place it on the
+            # accelerator device once and keep it there in eval mode
             self.ref_model = self.trainer.get_arch(self.trainer.config)
+            self.ref_model.requires_grad_(False)
             self.ref_model.to(self.trainer.accelerator.device)
+            self.ref_model.eval()
+
+            # Under mixed precision training keep the reference model's weights in
+            # the reduced precision too, halving its memory footprint and bandwidth.
+            # Seq2seq models (e.g. T5) are left out of fp16, since their activations
+            # are known to overflow in pure fp16
+            mixed_precision = self.trainer.accelerator.state.mixed_precision
+            if mixed_precision == "bf16":
+                self.ref_model.to(torch.bfloat16)
+            elif mixed_precision == "fp16" and self.trainer.config.model.model_arch_type != "seq2seq":
+                self.ref_model.to(torch.float16)
 
         # Set this orchestrator as a property on the trainer, so that the
         # trainer can call `make_experience` directly for each epoch.
@@ -113,51 +157,25 @@ class PPOOrchestrator(Orchestrator):
             device = samples.device
             str_samples, str_prompts, str_outputs = self.trainer.decode(prompt_tensors, samples)
 
-            # Pad the sample outputs
-            outputs = self.trainer.tokenizer(str_outputs).input_ids
-            outputs = list(map(torch.LongTensor, outputs))
-            maxsize = max(map(len, outputs))
-            outputs = [
-                F.pad(
-                    output,
-                    (0, maxsize - len(output)),
-                    value=self.trainer.tokenizer.pad_token_id,
+            if self.trainer.config.model.model_arch_type != "seq2seq" and not self.trainer.stop_sequences:
+                # Without stop sequences trimming the decoded outputs, the generated tokens (already
+                # right padded) can be used directly instead of re-tokenizing the decoded strings
+                sample_outputs = samples[:, prompt_tensors.shape[1] :]
+            else:
+                # Right pad the sample outputs into a single buffer and move it to device at once
+                outputs = self.trainer.tokenizer(str_outputs).input_ids
+                maxsize = max(map(len, outputs))
+                sample_outputs = torch.full(
+                    (len(outputs), maxsize),
+                    self.trainer.tokenizer.pad_token_id,
+                    dtype=torch.long,
                 )
-                for output in outputs
-            ]
-            sample_outputs = torch.vstack(outputs).to(device)
-
-            exp_score_time = time()
-
-            scores = torch.tensor(
-                self.trainer.reward_fn(
-                    samples=str_samples,
-                    prompts=str_prompts,
-                    outputs=str_outputs,
-                ),
-                dtype=torch.float,
-            ).to(device)
-            stats["time/exp_score"] = time() - exp_score_time
+                for ix, output in enumerate(outputs):
+                    sample_outputs[ix, : len(output)] = torch.as_tensor(output, dtype=torch.long)
+                sample_outputs = sample_outputs.to(device)
 
-            # store statistics of the initial rollout as reference
-            if self.ref_mean is None:
-                self.ref_mean, self.ref_std = scores.mean(), scores.std()
-            all_scores_mean, all_scores_std = self.running.update(scores)
-            stats["exp_scores/mean"] = all_scores_mean
-            stats["exp_scores/std"] = all_scores_std
-            stats["exp_scores/running_mean"] = self.running.mean
-            stats["exp_scores/running_std"] = self.running.std
-
-            if self.trainer.config.method.scale_reward == "running":
-                scores /= self.running.std
-            elif self.trainer.config.method.scale_reward == "ref":
-                scores /= self.ref_std
-
-            clip_reward = self.trainer.config.method.cliprange_reward
-            if clip_reward:
-                scores = torch.clip(scores, -clip_reward, clip_reward)
-
-            # Precompute logprobs, values
+            # Precompute logprobs, values. The forward passes are queued before calling the reward
+            # function, so that the device runs them while the host scores the samples
             if self.trainer.config.model.model_arch_type == "seq2seq":
                 attention_mask = batch.attention_mask.to(device)
                 prompt_tensors = batch.input_ids.to(device)
@@ -202,7 +220,36 @@ class PPOOrchestrator(Orchestrator):
                             attention_mask=attention_mask,
                             return_dict=False,
                         )
-                        ref_logits = ref_logits.to(device)
+
+            exp_score_time = time()
+
+            scores = torch.tensor(
+                self.trainer.reward_fn(
+                    samples=str_samples,
+                    prompts=str_prompts,
+                    outputs=str_outputs,
+                ),
+                dtype=torch.float,
+            ).to(device)
+            stats["time/exp_score"] = time() - exp_score_time
+
+            # store statistics of the initial rollout as reference
+            if self.ref_mean is None:
+                self.ref_mean, self.ref_std = scores.mean(), scores.std()
+            all_scores_mean, all_scores_std = self.running.update(scores)
+            stats["exp_scores/mean"] = all_scores_mean
+            stats["exp_scores/std"] = all_scores_std
+            stats["exp_scores/running_mean"] = self.running.mean
+            stats["exp_scores/running_std"] = self.running.std
+
+            if self.trainer.config.method.scale_reward == "running":
+                scores /= self.running.std
+            elif self.trainer.config.method.scale_reward == "ref":
+                scores /= self.ref_std
+
+            clip_reward = self.trainer.config.method.cliprange_reward
+            if clip_reward:
+                scores = torch.clip(scores, -clip_reward, clip_reward)
 
             if self.trainer.config.model.model_arch_type == "seq2seq":
                 logprobs = logprobs_of_labels(logits[:, :-1, :], sample_outputs[:, 1:])
@@ -211,13 +258,6 @@ class PPOOrchestrator(Orchestrator):
                 logprobs = logprobs_of_labels(logits[:, :-1, :], all_tokens[:, 1:])
                 ref_logprobs = logprobs_of_labels(ref_logits[:, :-1, :], all_tokens[:, 1:])
 
-            n_samples: int = samples.shape[0]
-            logprobs = logprobs.cpu()
-            ref_logprobs = ref_logprobs.cpu()
-            prompt_tensors = prompt_tensors.cpu()
-            sample_outputs = sample_outputs.cpu()
-
-            # Estimate the KL divergence between the model and reference model
             if self.trainer.config.model.model_arch_type == "seq2seq":
                 # Skip the beginning of sequence token
                 start = 1
@@ -227,50 +267,44 @@ class PPOOrchestrator(Orchestrator):
                 padding_token: int = 0
                 ends = (sample_outputs[:, start:] != padding_token).sum(1)
 
-                # Get the logprobs and values, for tokens that are not padding
-                # or beginning of sequences tokens. These are from the model
-                # (not the reference model)
-                all_logprobs = [logprobs[ix, start : ends[ix]] for ix in range(n_samples)]
-                all_values = [values[ix, start - 1 : ends[ix] - 1] for ix in range(n_samples)]
-
-                kl_divergence_estimate: List[torch.Tensor] = [
-                    -self.trainer.kl_ctl.value
-                    * (
-                        logprobs[sample_idx, start : ends[sample_idx]]
-                        - ref_logprobs[sample_idx, start : ends[sample_idx]]
-                    )
-                    for sample_idx in range(n_samples)
-                ]
-
+                # Values are predicted one position ahead of logprobs
+                values_start = start - 1
             # Else if not seq2seq (i.e. causal)
             else:
-                values = values.cpu()[:, :-1]
+                values = values[:, :-1]
                 start = prompt_tensors.shape[1] - 1
                 ends = start + attention_mask[:, start:].sum(1)
-                all_values = [values[ix, start : ends[ix]] for ix in range(n_samples)]
-                all_logprobs = [logprobs[ix, start : ends[ix]] for ix in range(n_samples)]
-
-                kl_divergence_estimate = -self.trainer.kl_ctl.value * (logprobs - ref_logprobs)
-                kl_divergence_estimate = [rs[start : ends[ix]] for ix, rs in enumerate(kl_divergence_estimate)]
+                values_start = start
+
+            logprobs, values, rewards, response_lengths = slice_rollouts(
+                logprobs,
+                ref_logprobs,
+                values,
+                scores,
+                start,
+                ends,
+                values_start,
+                self.trainer.kl_ctl.value,
+            )
+            logprobs = logprobs.cpu()
+            values = values.cpu()
+            rewards = rewards.cpu()
+            prompt_tensors = prompt_tensors.cpu()
+            sample_outputs = sample_outputs.cpu()
 
             rollout_count = 0
 
-            for sample_idx in range(n_samples):
-                sample_kl_divergence_estimate = kl_divergence_estimate[sample_idx]
-
-                if len(sample_kl_divergence_estimate) == 0 or len(all_logprobs[sample_idx]) == 0:
+            for sample_idx, response_length in enumerate(response_lengths):
+                if response_length <= 0:
                     continue
 
-                rewards = sample_kl_divergence_estimate
-                rewards[-1] += scores[sample_idx].cpu()
-
                 ppo_rl_elements.append(
                     PPORLElement(
                         query_tensor=prompt_tensors[sample_idx],
                         response_tensor=sample_outputs[sample_idx],
-                        logprobs=all_logprobs[sample_idx],
-                        values=all_values[sample_idx],
-                        rewards=rewards,
+                        logprobs=logprobs[sample_idx, :response_length],
+                        values=values[sample_idx, :response_length],
+                        rewards=rewards[sample_idx, :response_length],
                     )
                 )
 
@@ -3,6 +3,7 @@ import os
 import time
 from typing import Iterable
 
+import torch
 from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data import DataLoader
 
@@ -77,4 +78,11 @@ class PPORolloutStorage(BaseRolloutStore):
                 ),
             )
 
-        return DataLoader(self, batch_size, shuffle=shuffle, collate_fn=collate_fn)
+        # Pinned batches can be copied to the GPU asynchronously with `non_blocking=True`
+        return DataLoader(
+            self,
+            batch_size,
+            shuffle=shuffle,
+            collate_fn=collate_fn,
+            pin_memory=torch.cuda.is_available(),
+        )
@@ -5,6 +5,7 @@ from datasets import load_dataset
 
 import trlx
 from trlx.data.configs import TRLConfig
+from trlx.utils import get_pipeline_device_kwargs, get_positive_score
 
 
 def ppo_sentiments_train(config: dict):
@@ -12,11 +13,18 @@ def ppo_sentiments_train(config: dict):
 
     config = TRLConfig.from_dict(config)
 
-    sentiment_fn = pipeline("sentiment-analysis", "lvwerra/distilbert-imdb", device=-1)
+    sentiment_fn = pipeline(
+        "sentiment-analysis",
+        "lvwerra/distilbert-imdb",
+        top_k=2,
+        truncation=True,
+        batch_size=256,
+        **get_pipeline_device_kwargs(),
+    )
 
     def reward_fn(samples, **kwargs):
-        outputs = sentiment_fn(samples, return_all_scores=True)
-        sentiments = [output[1]["score"] for output in outputs]
+        outputs = sentiment_fn(samples)
+        sentiments = list(map(get_positive_score, outputs))
         return sentiments
 
     # Take few words off of movies reviews as prompts
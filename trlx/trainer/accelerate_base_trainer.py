@@ -2,6 +2,8 @@ import json
 import os
 import sys
 from abc import abstractmethod
+from contextlib import nullcontext
+from dataclasses import fields
 from time import time
 from typing import Dict, List, Optional, Sequence, Tuple, Union
 
@@ -25,6 +27,8 @@ from trlx.utils import (
     get_optimizer_class,
     get_scheduler_class,
     significant,
+    split_batch,
+    to_device,
 )
 from trlx.utils.modeling import (
     flatten_dict,
@@ -46,7 +50,23 @@ class AccelerateRLTrainer(BaseRLTrainer):
     def __init__(self, config, **kwargs):  # noqa: C901
         super().__init__(config, **kwargs)
         self.max_length = config.train.seq_length
-        self.accelerator = Accelerator(log_with=config.train.tracker, logging_dir=config.train.logging_dir)
+
+        # Split each batch into `num_mb` minibatches and accumulate their gradients
+        self.mb_size = config.train.minibatch_size or config.train.batch_size
+        if config.train.batch_size % self.mb_size != 0:
+            raise ValueError(
+                f"`batch_size` ({config.train.batch_size}) must be divisible by `minibatch_size` ({self.mb_size})"
+            )
+        self.num_mb = config.train.batch_size // self.mb_size
+
+        # `gradient_accumulation_steps` scales the loss in `backward`. Without DeepSpeed, `train_step` steps the
+        # optimizer itself once per batch. DeepSpeed's engine instead steps every `num_mb` backward passes,
+        # so `learn` only trains on batches that split into exactly `num_mb` minibatches
+        self.accelerator = Accelerator(
+            log_with=config.train.tracker,
+            logging_dir=config.train.logging_dir,
+            gradient_accumulation_steps=self.num_mb,
+        )
 
         if self.accelerator.state.deepspeed_plugin is not None:
             # by accelerate's default, arguments in `model.forward` would be casted to half
@@ -150,8 +170,9 @@ class AccelerateRLTrainer(BaseRLTrainer):
         Returns an optimizer derived from an instance's TRLConfig
         """
         optimizer_class = get_optimizer_class(self.config.optimizer.name)
+        # Only hand over parameters left trainable after freezing layers (or delta tuning)
         optimizer = optimizer_class(
-            self.model.parameters(),
+            [p for p in self.model.parameters() if p.requires_grad],
             **self.config.optimizer.kwargs,
         )
 
@@ -207,16 +228,23 @@ class AccelerateRLTrainer(BaseRLTrainer):
             # Assuming prompts were left-padded
             prompt_sizes = [prompts.shape[1]] * len(prompts)
 
-        str_samples, str_prompts, str_outputs = [], [], []
-        for prompt, sample, prompt_size in zip(prompts, samples, prompt_sizes):
-            if self.config.model.model_arch_type == "seq2seq":
-                output_start_ix = 0
-            else:
-                output_start_ix = prompt_size
+        if self.config.model.model_arch_type == "seq2seq":
+            output_start_ixs = [0] * len(samples)
+        else:
+            output_start_ixs = prompt_sizes
 
-            str_prompt = self.tokenizer.decode(prompt[:prompt_size], skip_special_tokens=True)
-            str_output = self.tokenizer.decode(sample[output_start_ix:], skip_special_tokens=True)
+        # Decode the whole batch at once rather than sample by sample
+        all_str_prompts = self.tokenizer.batch_decode(
+            [prompt[:prompt_size] for prompt, prompt_size in zip(prompts, prompt_sizes)],
+            skip_special_tokens=True,
+        )
+        all_str_outputs = self.tokenizer.batch_decode(
+            [sample[output_start_ix:] for sample, output_start_ix in zip(samples, output_start_ixs)],
+            skip_special_tokens=True,
+        )
 
+        str_samples, str_prompts, str_outputs = [], [], []
+        for str_prompt, str_output in zip(all_str_prompts, all_str_outputs):
             # Trim outputs up to `self.stop_sequences` if any are present
             if self.stop_sequences:
                 for stop in self.stop_sequences:
@@ -246,7 +274,7 @@ class AccelerateRLTrainer(BaseRLTrainer):
         else:
             kwargs = dict(self.generate_kwargs, **kwargs)
 
-        with torch.no_grad():
+        with torch.inference_mode():
             return self.accelerator.unwrap_model(self.model).generate(
                 input_ids=input_ids, attention_mask=attention_mask, **kwargs
             )
@@ -259,7 +287,7 @@ class AccelerateRLTrainer(BaseRLTrainer):
 
         kwargs = dict(self.generate_kwargs, **kwargs)
 
-        with torch.no_grad():
+        with torch.inference_mode():
             return self.accelerator.unwrap_model(self.model).generate(
                 input_ids=input_ids, attention_mask=attention_mask, **kwargs
             )
@@ -442,6 +470,51 @@ class AccelerateRLTrainer(BaseRLTrainer):
         self.nth_evaluation += 1
         return stats
 
+    def train_step(self, batch) -> Dict[str, float]:
+        """
+        Performs a single optimizer update on `batch`, accumulating gradients over its minibatches,
+        and returns the update's stats reduced over the minibatches
+        """
+        forward_time = 0
+        backward_time = 0
+        # Reshuffle which samples share a minibatch on every update
+        minibatches = split_batch(batch, self.num_mb, shuffle=True)
+        mb_stats = []
+        for mb_ix, minibatch in enumerate(minibatches):
+            # Gradients are only synchronized across processes on the last minibatch
+            if mb_ix == len(minibatches) - 1:
+                sync_context = nullcontext()
+            else:
+                sync_context = self.accelerator.no_sync(self.model)
+
+            with sync_context:
+                forward_time -= time()
+                loss, stats = self.loss(minibatch)
+                forward_time += time()
+                backward_time -= time()
+                self.accelerator.backward(loss)
+                backward_time += time()
+            mb_stats.append(stats)
+
+        self.opt.step()
+        self.opt.zero_grad()
+        self.scheduler.step()
+
+        # Reduce the stats over minibatches: extremes are kept, the rest is averaged as the loss is
+        stats = {}
+        for k in mb_stats[0]:
+            values = [s[k] for s in mb_stats]
+            if k.endswith("/min"):
+                stats[k] = min(values)
+            elif k.endswith("/max"):
+                stats[k] = max(values)
+            else:
+                stats[k] = sum(values) / len(values)
+
+        stats["time/forward"] = forward_time
+        stats["time/backward"] = backward_time
+        return stats
+
     def learn(self):  # noqa: C901
         """
         Samples batches from `self.store`, updates model and periodically evaluates it on `self.eval_dataloader`
@@ -488,29 +561,26 @@ class AccelerateRLTrainer(BaseRLTrainer):
         for _ in range(self.config.train.epochs):
             # For each batch
             for batch in self.train_dataloader:
+                # Skip a final batch with fewer samples than minibatches, as its fewer backward passes would
+                # shift DeepSpeed's optimizer steps away from batch boundaries for the rest of training
+                if len(getattr(batch, fields(batch)[0].name)) < self.num_mb:
+                    continue
+
+                # Move the batch to device before it is split, as shuffling copies it into new
+                # (unpinned) tensors. The copy is asynchronous if the batch is pinned
+                batch = to_device(batch, self.accelerator.device, non_blocking=True)
                 # For each update per batch
                 for _ in range(self.n_updates_per_batch):
                     # Note that whereas standard policy gradient methods perform one
                     # gradient update per batch, PPO for example commonly performs
                     # multiple gradient updates on the same batch of data.
                     # https://arxiv.org/pdf/1707.06347.pdf
-                    forward_time = time()
-                    loss, stats = self.loss(batch)
-                    forward_time = time() - forward_time
-                    backward_time = time()
-                    self.accelerator.backward(loss)
-                    backward_time = time() - backward_time
-
-                    self.opt.step()
-                    self.opt.zero_grad()
-                    self.scheduler.step()
+                    stats = self.train_step(batch)
                     self.iter_count += 1
 
                     if self.iter_count % self.config.train.checkpoint_interval == 0:
                         self.save()
 
-                    stats["time/forward"] = forward_time
-                    stats["time/backward"] = backward_time
                     for group_number, lr in enumerate(self.scheduler.get_last_lr()):
                         stats[f"learning_rate_group_{group_number}"] = lr
 
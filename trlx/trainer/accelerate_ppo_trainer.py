@@ -18,6 +18,7 @@ from trlx.trainer.nn.ppo_models import (
     FixedKLController,
     Seq2SeqLMHydraWithValueHead,
 )
+from trlx.utils import to_device
 from trlx.utils.modeling import logprobs_of_labels
 
 
@@ -120,11 +121,12 @@ class AcceleratePPOTrainer(AccelerateRLTrainer):
             batch: Previous batch of episodes
         """
         # Move `batch` data to `accelerator` device
-        query_tensors = batch.query_tensors.to(self.accelerator.device)
-        response_tensors = batch.response_tensors.to(self.accelerator.device)
-        old_logprobs = batch.logprobs.to(self.accelerator.device)
-        old_values = batch.values.to(self.accelerator.device)
-        old_rewards = batch.rewards.to(self.accelerator.device)
+        batch = to_device(batch, self.accelerator.device)
+        query_tensors = batch.query_tensors
+        response_tensors = batch.response_tensors
+        old_logprobs = batch.logprobs
+        old_values = batch.values
+        old_rewards = batch.rewards
         response_length = old_rewards.shape[1]
 
         advantages, returns = self.config.method.get_advantages_and_returns(old_values, old_rewards, response_length)
@@ -178,9 +180,14 @@ class AcceleratePPOTrainer(AccelerateRLTrainer):
             returns=returns,
             mask=mask,
         )
-        self.approx_kl = stats["policy/approx_kl"]  # Update kl controller stats
         return loss, stats
 
+    def train_step(self, batch: PPORLBatch):
+        stats = super().train_step(batch)
+        # Update kl controller stats with the estimate over all minibatches of the batch
+        self.approx_kl = stats["policy/approx_kl"]
+        return stats
+
     def setup_rollout_logging(self, config):
         # Make rollout logging dir for this run and store config
         exists = os.path.exists(config.train.rollout_logging_dir)
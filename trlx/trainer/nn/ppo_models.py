@@ -154,14 +154,21 @@ class PPOConfig(MethodConfig):
         - response_length: Length of the response sequence
         - use_whitening: Whether to use whitening (ie. normalize advantages) or not
         """
-        lastgaelam = 0
-        advantages_reversed = []
-        for t in reversed(range(response_length)):
-            nextvalues = values[:, t + 1] if t < response_length - 1 else 0.0
-            delta = rewards[:, t] + self.gamma * nextvalues - values[:, t]
-            lastgaelam = delta + self.gamma * self.lam * lastgaelam
-            advantages_reversed.append(lastgaelam)
-        advantages = torch.stack(advantages_reversed[::-1], dim=1)
+        values, rewards = values[:, :response_length], rewards[:, :response_length]
+        nextvalues = torch.cat((values[:, 1:], torch.zeros_like(values[:, :1])), dim=1)
+        deltas = rewards + self.gamma * nextvalues - values
+
+        # Advantages are the (γλ)-discounted reverse cumulative sums of deltas:
+        # Adv_t = Σ_{k >= t} (γλ)^(k - t) * δ_k, computed as a single matmul with an
+        # upper triangular discount matrix instead of a loop over timesteps
+        steps = torch.arange(response_length, device=values.device)
+        offsets = steps.unsqueeze(0) - steps.unsqueeze(1)
+        discounts = torch.where(
+            offsets >= 0,
+            (self.gamma * self.lam) ** offsets.clamp(min=0).to(deltas.dtype),
+            torch.zeros((), dtype=deltas.dtype, device=values.device),
+        )
+        advantages = deltas @ discounts.T
         returns = advantages + values
         if use_whitening:
             advantages = whiten(advantages)
@@ -212,9 +219,9 @@ class PPOConfig(MethodConfig):
 
         stats = dict(
             losses=dict(
-                total_loss=loss.item(),
-                policy_loss=pg_loss.item(),
-                value_loss=vf_loss.item(),
+                total_loss=loss,
+                policy_loss=pg_loss,
+                value_loss=vf_loss,
             ),
             values=dict(
                 get_tensor_stats(values, mask, n),
@@ -223,12 +230,15 @@ class PPOConfig(MethodConfig):
             ),
             old_values=get_tensor_stats(old_values, mask, n),
             returns=get_tensor_stats(returns, mask, n),
-            policy=dict(approx_kl=approx_kl.item(), clipfrac=pg_clipfrac.item()),
+            policy=dict(approx_kl=approx_kl, clipfrac=pg_clipfrac),
             ratio=(ratio * mask).sum() / n,
             padding_percentage=n / mask.numel(),
         )
+        stats = flatten_dict(stats)
 
-        return loss, flatten_dict(stats)
+        # Copy all scalar stats to the host at once instead of synchronizing on each of them
+        scalars = torch.stack([x.detach().float() for x in stats.values()]).tolist()
+        return loss, dict(zip(stats.keys(), scalars))
 
 
 # PPO Layers
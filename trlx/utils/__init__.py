@@ -3,10 +3,10 @@ import os
 import random
 import subprocess
 import time
-from dataclasses import is_dataclass
+from dataclasses import fields, is_dataclass
 from enum import Enum
 from numbers import Number
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 import numpy as np
 import torch
@@ -214,6 +214,44 @@ def tree_map(f, tree: Any) -> Any:
         return f(tree)
 
 
+def split_batch(batch: Any, num_chunks: int, shuffle: bool = False) -> List[Any]:
+    """
+    Split a dataclass of batched tensors into `num_chunks` (nearly) equally sized
+    batches of the same type along the first dimension, optionally shuffling samples
+    across the chunks beforehand. A batch with fewer than `num_chunks` samples is split
+    into single samples, so that no chunk is empty
+    """
+    if num_chunks == 1:
+        return [batch]
+
+    names = [f.name for f in fields(batch)]
+    tensors = [getattr(batch, name) for name in names]
+    num_chunks = min(num_chunks, len(tensors[0]))
+    if shuffle:
+        permutation = torch.randperm(len(tensors[0]))
+        tensors = [x[permutation.to(x.device)] for x in tensors]
+
+    chunks = [torch.tensor_split(x, num_chunks) for x in tensors]
+    return [batch.__class__(**dict(zip(names, values))) for values in zip(*chunks)]
+
+
+def get_pipeline_device_kwargs() -> Dict[str, Any]:
+    """
+    Returns `device` and `torch_dtype` arguments for a `transformers.pipeline`, placing it
+    in half precision on this process' local GPU if available and on CPU otherwise
+    """
+    if torch.cuda.is_available():
+        return dict(device=int(os.environ.get("LOCAL_RANK", 0)), torch_dtype=torch.float16)
+    return dict(device=-1, torch_dtype=torch.float32)
+
+
+def get_positive_score(scores):
+    """
+    Extract value associated with a positive sentiment from pipeline's output
+    """
+    return next(score["score"] for score in scores if score["label"] == "POSITIVE")
+
+
 def to_device(tree, device, non_blocking=False):
     """
     Move all tensors in tree to device
@@ -210,8 +210,9 @@ def whiten(xs: torch.Tensor, shift_mean=True, distributed=True) -> torch.Tensor:
 def logprobs_of_labels(logits, labels):
     """Log probabilities of the labels
 
-    These are calculated from the logits."""
-    logprobs = F.log_softmax(logits, dim=-1)
+    These are calculated from the logits, upcasting them to fp32 for numerical
+    stability when they come from a reduced precision model."""
+    logprobs = F.log_softmax(logits.float(), dim=-1)
     logprobs_labels = torch.gather(logprobs, dim=-1, index=labels.unsqueeze(-1))
     return logprobs_labels.squeeze(-1)
 